@@ -7,6 +7,7 @@ from shapely.geometry import Polygon, Point
 
 # local
 from utils import ensure_path_exists, extract_coords
+from transformer_cache import get_transformer, get_transformer_accuracy
 
 
 def pyproj_transform_shape(poly_gdf: gpd.GeoDataFrame, alt: float,
@@ -15,13 +16,10 @@ def pyproj_transform_shape(poly_gdf: gpd.GeoDataFrame, alt: float,
     # extract coords
     coords = extract_coords(poly_gdf)
     new_poly_gdf = gpd.GeoDataFrame()
-    # define transformer
-    transformer = pyproj.Transformer.from_crs(
-        f"EPSG:{source_refsys_epsg}", f"EPSG:{target_refsys_epsg}",
-        always_xy=True,
-        allow_ballpark=False
-    )
-    print(f"Transform from EPSG:{source_refsys_epsg} to EPSG:{target_refsys_epsg} with accuracy: {transformer.accuracy}")
+    # define transformer, rebuilt from the cached PROJ pipeline (see transformer_cache.py)
+    transformer = get_transformer(source_refsys_epsg, target_refsys_epsg)
+    accuracy = get_transformer_accuracy(source_refsys_epsg, target_refsys_epsg)
+    print(f"Transform from EPSG:{source_refsys_epsg} to EPSG:{target_refsys_epsg} with accuracy: {accuracy}")
     # iterate over points
     new_points = []
     for point in coords:
@@ -0,0 +1,155 @@
+import collections
+import functools
+
+# third party libs
+import numpy as np
+import pyproj
+
+
+# 14 transformation parameters from EUREF-TN-1 (docs/EUREF-TN-1-Mar-04-2024.pdf)
+# (source, target): (reference epoch, [T1, T2, T3, D, R1, R2, R3], [rates])
+# units: T mm, D 10^-9, R mas and the same per year for the rates
+FRAME_PARAMETERS = {
+    # Appendix A, ITRF2020 to past ITRFyy at epoch 2015.0
+    ("ITRF2020", "ITRF2014"): (2015.0, [-1.4, -0.9, 1.4, -0.42, 0.00, 0.00, 0.00],
+                               [0.0, -0.1, 0.2, 0.00, 0.00, 0.00, 0.00]),
+    ("ITRF2020", "ITRF2008"): (2015.0, [0.2, 1.0, 3.3, -0.29, 0.00, 0.00, 0.00],
+                               [0.0, -0.1, 0.1, 0.03, 0.00, 0.00, 0.00]),
+    ("ITRF2020", "ITRF2005"): (2015.0, [2.7, 0.1, -1.4, 0.65, 0.00, 0.00, 0.00],
+                               [0.3, -0.1, 0.1, 0.03, 0.00, 0.00, 0.00]),
+    ("ITRF2020", "ITRF2000"): (2015.0, [-0.2, 0.8, -34.2, 2.25, 0.00, 0.00, 0.00],
+                               [0.1, 0.0, -1.7, 0.11, 0.00, 0.00, 0.00]),
+    # Table 1, ITRFyy to ETRFyy at epoch 1989.0
+    ("ITRF2020", "ETRF2020"): (1989.0, [0.0, 0.0, 0.0, 0.00, 0.000, 0.000, 0.000],
+                               [0.0, 0.0, 0.0, 0.00, 0.086, 0.519, -0.753]),
+    ("ITRF2014", "ETRF2014"): (1989.0, [0.0, 0.0, 0.0, 0.00, 0.000, 0.000, 0.000],
+                               [0.0, 0.0, 0.0, 0.00, 0.085, 0.531, -0.770]),
+    ("ITRF2005", "ETRF2005"): (1989.0, [56.0, 48.0, -37.0, 0.00, 0.000, 0.000, 0.000],
+                               [0.0, 0.0, 0.0, 0.00, 0.054, 0.518, -0.781]),
+    ("ITRF2000", "ETRF2000"): (1989.0, [54.0, 51.0, -48.0, 0.00, 0.000, 0.000, 0.000],
+                               [0.0, 0.0, 0.0, 0.00, 0.081, 0.490, -0.792]),
+}
+
+MAS_TO_RAD = 1 / 206264806.247
+
+
+def _frame_graph() -> dict:
+    graph = collections.defaultdict(list)
+    for source, target in FRAME_PARAMETERS:
+        graph[source].append((target, 1))
+        # inverse transformation, same parameters with opposite sign
+        graph[target].append((source, -1))
+    return graph
+
+
+def frame_path(source_frame: str, target_frame: str) -> list[tuple[str, str, int]]:
+    """ Shortest chain of tabulated transformations from source_frame to target_frame (BFS) """
+    graph = _frame_graph()
+    if source_frame not in graph or target_frame not in graph:
+        raise ValueError(f"Unknown frame {source_frame} or {target_frame}, known: {sorted(graph)}")
+
+    previous = {source_frame: None}
+    queue = collections.deque([source_frame])
+    while queue:
+        frame = queue.popleft()
+        if frame == target_frame:
+            break
+        for next_frame, sign in graph[frame]:
+            if next_frame not in previous:
+                previous[next_frame] = (frame, sign)
+                queue.append(next_frame)
+
+    path = []
+    frame = target_frame
+    while previous[frame] is not None:
+        prev_frame, sign = previous[frame]
+        path.append((prev_frame, frame, sign))
+        frame = prev_frame
+    return path[::-1]
+
+
+def _parameters_at_epoch(source_frame: str, target_frame: str, sign: int, epoch: float) -> np.ndarray:
+    key = (source_frame, target_frame) if sign > 0 else (target_frame, source_frame)
+    ref_epoch, params, rates = FRAME_PARAMETERS[key]
+    # P(tc) = P(t0) + P_dot * (tc - t0), equation 5
+    return sign * (np.array(params) + np.array(rates) * (epoch - ref_epoch))
+
+
+@functools.lru_cache(maxsize=256)
+def composed_helmert(source_frame: str, target_frame: str, epoch: float) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Pre-composes the chain source_frame -> ... -> target_frame at epoch into one transformation.
+    The parameters are small, so like Tables 2, 3 and 4 of EUREF-TN-1 the chain is the sum of its steps.
+
+    Returns:
+        (matrix, translation) such that X_target = matrix @ X_source + translation, in metres
+    """
+    params = np.zeros(7)
+    for step_source, step_target, sign in frame_path(source_frame, target_frame):
+        params += _parameters_at_epoch(step_source, step_target, sign, epoch)
+
+    translation = params[0:3] / 1000  # mm to m
+    scale = params[3] * 10**-9
+    r1, r2, r3 = params[4:7] * MAS_TO_RAD
+    # X2 = X1 + T + D.X1 + R.X1, equation 1
+    matrix = np.array([[1 + scale, -r3, r2],
+                       [r3, 1 + scale, -r1],
+                       [-r2, r1, 1 + scale]])
+    matrix.flags.writeable = False
+    translation.flags.writeable = False
+    return matrix, translation
+
+
+def transform_frame_xyz(xyz: np.ndarray, source_frame: str, target_frame: str, epoch: float) -> np.ndarray:
+    """ Transforms an (N, 3) array of geocentric coordinates between frames at epoch, in one pass """
+    matrix, translation = composed_helmert(source_frame, target_frame, float(epoch))
+    return np.asarray(xyz, dtype=float) @ matrix.T + translation
+
+
+def transform_frame_xyz_epochs(xyz: np.ndarray, source_frame: str, target_frame: str,
+                               epochs: np.ndarray) -> np.ndarray:
+    """ Like transform_frame_xyz with one epoch per point, the parameters are linear in time """
+    xyz = np.asarray(xyz, dtype=float)
+    matrix_0, translation_0 = composed_helmert(source_frame, target_frame, 2015.0)
+    matrix_1, translation_1 = composed_helmert(source_frame, target_frame, 2016.0)
+    dt = (np.asarray(epochs, dtype=float) - 2015.0)[:, None]
+    return (xyz @ matrix_0.T + translation_0
+            + dt * (xyz @ (matrix_1 - matrix_0).T + (translation_1 - translation_0)))
+
+
+@functools.lru_cache(maxsize=None)
+def grs80_cart() -> pyproj.Transformer:
+    # ITRF and ETRF coordinates are both expressed on GRS80
+    return pyproj.Transformer.from_pipeline("+proj=cart +ellps=GRS80")
+
+
+def transform_frame_lon_lat(lon, lat, elev, source_frame: str, target_frame: str, epoch: float):
+    """ Same as transform_frame_xyz for ellipsoidal coordinates (degrees, metres), scalars or arrays """
+    cart = grs80_cart()
+    x, y, z = cart.transform(lon, lat, elev)
+    xyz = transform_frame_xyz(np.column_stack([x, y, z]), source_frame, target_frame, epoch)
+    lon, lat, elev = cart.transform(xyz[:, 0], xyz[:, 1], xyz[:, 2], direction="INVERSE")
+    if np.ndim(x) == 0:
+        return lon[0], lat[0], elev[0]
+    return lon, lat, elev
+
+
+def test_euref_tn1_examples():
+    # EUREF-TN-1 Appendix B, Example 1 at epoch tc = 2010.0, compare with
+    # https://epncb.oma.be/_productsservices/coord_trans/index.php#results
+    itrf2020 = np.array([[4027893.6750, 307045.9069, 4919475.1721]])
+    expected = {
+        "ETRF2020": [4027893.9585, 307045.5550, 4919474.9619],
+        "ITRF2014": [4027893.6719, 307045.9064, 4919475.1704],
+        "ETRF2014": [4027893.9620, 307045.5480, 4919474.9553],
+        "ITRF2000": [4027893.6812, 307045.9082, 4919475.1547],
+        "ETRF2000": [4027894.0053, 307045.5939, 4919474.9083],
+    }
+    for frame, xyz in expected.items():
+        new_xyz = transform_frame_xyz(itrf2020, "ITRF2020", frame, 2010.0)[0]
+        print(frame, *new_xyz, np.abs(new_xyz - xyz).max())
+        assert np.allclose(new_xyz, xyz, atol=0.0001)
+
+
+if __name__ == "__main__":
+    test_euref_tn1_examples()
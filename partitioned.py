@@ -0,0 +1,202 @@
+import functools
+import os
+import tempfile
+
+# third party libs
+import numpy as np
+import shapely
+import geopandas as gpd
+import dask_geopandas
+from dask.distributed import Client
+
+# local
+from utils import ensure_path_exists
+from transformer_cache import get_transformer
+from etrs89_to_itrs import pyproj_transform_shape
+from stereo70_to_etrs89 import stereo70_to_etrs89_with_pytransdatro
+from pytransdatro import TransRO
+
+
+def pyproj_transform_geoseries(geoms: gpd.GeoSeries, alt: float,
+                               source_refsys_epsg: int, target_refsys_epsg: int,
+                               observation_epoch: float) -> gpd.GeoSeries:
+    """ Vectorized version of etrs89_to_itrs.pyproj_transform_shape for every geometry of a series """
+    # cached per process, each dask worker builds the transformer once
+    transformer = get_transformer(source_refsys_epsg, target_refsys_epsg)
+
+    def _transform(coords: np.ndarray) -> np.ndarray:
+        # missing heights inside 3D geometries, use the assumed one too
+        z = np.where(np.isnan(coords[:, 2]), alt, coords[:, 2])
+        t = np.full(len(coords), observation_epoch)
+        lon, lat, h, _ = transformer.transform(
+            xx=coords[:, 0], yy=coords[:, 1], zz=z, tt=t)
+        return np.column_stack([lon, lat, h])
+
+    # 2D geometries get the assumed height, the output is always 3D like pyproj_transform_shape
+    new_geoms = shapely.transform(shapely.force_3d(geoms.values, z=alt), _transform, include_z=True)
+    return gpd.GeoSeries(new_geoms, index=geoms.index, crs=f"EPSG:{target_refsys_epsg}")
+
+
+@functools.lru_cache(maxsize=None)
+def _transro():
+    # PyTransDatRO loads its grids on construction, keep one instance per worker
+    return TransRO()
+
+
+def stereo70_to_etrs89_geoseries(geoms: gpd.GeoSeries, height: float, target_refsys_epsg: int) -> gpd.GeoSeries:
+    """
+    stereo70_to_etrs89.stereo70_to_etrs89_shape for every geometry of a series.
+    Not vectorized, PyTransDatRO only works point by point, so this loops over every vertex.
+    """
+    t = _transro()
+
+    def _transform(coords: np.ndarray) -> np.ndarray:
+        out = np.empty_like(coords)
+        for i, (east, north) in enumerate(coords[:, :2]):
+            lat, lon, h = stereo70_to_etrs89_with_pytransdatro(
+                t=t, north=north, east=east, height=height)
+            out[i, :2] = lon, lat
+            if h is not None:
+                out[i, 2] = h
+        return out
+
+    # without a height PyTransDatRO only converts in 2D
+    if height is None:
+        new_geoms = shapely.transform(geoms.values, _transform, include_z=False)
+    else:
+        new_geoms = shapely.transform(geoms.values, _transform, include_z=True)
+    return gpd.GeoSeries(new_geoms, index=geoms.index, crs=f"EPSG:{target_refsys_epsg}")
+
+
+def pyproj_transform_partition(partition: gpd.GeoDataFrame, alt: float,
+                               source_refsys_epsg: int, target_refsys_epsg: int,
+                               observation_epoch: float) -> gpd.GeoDataFrame:
+    new_geoms = pyproj_transform_geoseries(
+        partition.geometry, alt, source_refsys_epsg, target_refsys_epsg, observation_epoch)
+    return partition.set_geometry(new_geoms, crs=new_geoms.crs)
+
+
+def stereo70_to_etrs89_partition(partition: gpd.GeoDataFrame, height: float,
+                                 target_refsys_epsg: int) -> gpd.GeoDataFrame:
+    new_geoms = stereo70_to_etrs89_geoseries(partition.geometry, height, target_refsys_epsg)
+    return partition.set_geometry(new_geoms, crs=new_geoms.crs)
+
+
+def get_client(scheduler_address: str = None, n_workers: int = None) -> Client:
+    """
+    Connects to a running multi-node scheduler (e.g. "tcp://scheduler:8786"),
+    or starts a LocalCluster on this machine when no address is given.
+    """
+    if scheduler_address:
+        return Client(scheduler_address)
+    return Client(n_workers=n_workers, threads_per_worker=1)
+
+
+def read_partitioned(source_path: str, npartitions: int) -> dask_geopandas.GeoDataFrame:
+    if source_path.endswith(".parquet") or os.path.isdir(source_path):
+        ddf = dask_geopandas.read_parquet(source_path)
+    else:
+        ddf = dask_geopandas.read_file(source_path, npartitions=npartitions)
+    # neighbouring features end up in the same partition, output files stay spatially compact
+    return ddf.spatial_shuffle(npartitions=npartitions)
+
+
+def transform_partitioned(ddf: dask_geopandas.GeoDataFrame, partition_func, target_refsys_epsg: int,
+                          **kwargs) -> dask_geopandas.GeoDataFrame:
+    meta = ddf._meta.set_crs(f"EPSG:{target_refsys_epsg}", allow_override=True)
+    return ddf.map_partitions(
+        partition_func, target_refsys_epsg=target_refsys_epsg, meta=meta, **kwargs)
+
+
+def pyproj_transform_partitioned_and_save(source_path: str, destination_path: str, height: float,
+                                          source_refsys_epsg: int, target_refsys_epsg: int,
+                                          observation_epoch: float, npartitions: int):
+    ddf = read_partitioned(source_path, npartitions)
+    new_ddf = transform_partitioned(
+        ddf, pyproj_transform_partition, target_refsys_epsg,
+        alt=height, source_refsys_epsg=source_refsys_epsg, observation_epoch=observation_epoch)
+    # one parquet file per partition, written by the workers themselves
+    new_ddf.to_parquet(destination_path)
+
+
+def stereo70_to_etrs89_partitioned_and_save(source_path: str, destination_path: str, height: float,
+                                            target_refsys_epsg: int, npartitions: int):
+    ddf = read_partitioned(source_path, npartitions)
+    new_ddf = transform_partitioned(
+        ddf, stereo70_to_etrs89_partition, target_refsys_epsg, height=height)
+    new_ddf.to_parquet(destination_path)
+
+
+def main():
+    ############
+    # settings #
+    ############
+    # scheduler_address = "tcp://scheduler:8786"  # multi-node cluster
+    scheduler_address = None  # LocalCluster
+    npartitions = 64
+
+    county_id = 403  # Bucuresti
+    area_id = "all"
+
+    # set epoch of observations
+    observation_epoch = 2022.00
+    height = 112  # assume height
+
+    source_refsys = 7931  # ETRF2000 - Ellipsoidal 3D CS https://epsg.io/7931
+    target_refsys = 9990  # ITRF2020 - Geographic 2D
+
+    source_path = os.path.join(
+        'data', 'convert_transdatro', str(county_id), str(source_refsys), f"{area_id}.parquet")
+    destination_data_dir = os.path.join(
+        'data', 'convert_pyproj', str(county_id), str(target_refsys))
+    ensure_path_exists(destination_data_dir)
+    destination_path = os.path.join(destination_data_dir, f"{area_id}.parquet")
+
+    with get_client(scheduler_address):
+        pyproj_transform_partitioned_and_save(
+            source_path=source_path,
+            destination_path=destination_path,
+            height=height,
+            source_refsys_epsg=source_refsys,
+            target_refsys_epsg=target_refsys,
+            observation_epoch=observation_epoch,
+            npartitions=npartitions,
+        )
+
+
+def test_partitioned_local_cluster():
+    # same output as etrs89_to_itrs.pyproj_transform_shape, run on a 2 worker LocalCluster
+    tmp_dir = tempfile.mkdtemp()
+    source_path = os.path.join(
+        'data', 'convert_transdatro', '403', '179169', '7931', '229896', '229896.geojson')
+    # the same polygon without heights, 2D input gets the assumed height and comes back 3D
+    source_gdf = gpd.read_file(source_path)
+    source_2d_path = os.path.join(tmp_dir, "229896_2d.geojson")
+    source_gdf.set_geometry(shapely.force_2d(source_gdf.geometry.values)).to_file(
+        source_2d_path, driver="GeoJSON")
+    height, source_refsys, target_refsys, observation_epoch = 112, 7931, 9990, 2022.0
+
+    with get_client(n_workers=2):
+        for path in [source_path, source_2d_path]:
+            destination_path = os.path.join(tmp_dir, os.path.basename(path) + ".parquet")
+            pyproj_transform_partitioned_and_save(
+                source_path=path,
+                destination_path=destination_path,
+                height=height,
+                source_refsys_epsg=source_refsys,
+                target_refsys_epsg=target_refsys,
+                observation_epoch=observation_epoch,
+                npartitions=2,
+            )
+
+            new_gdf = gpd.read_parquet(destination_path)
+            expected_gdf = pyproj_transform_shape(
+                gpd.read_file(path), height, source_refsys, target_refsys, observation_epoch)
+            assert new_gdf.crs == expected_gdf.crs
+            assert new_gdf.geometry.has_z.all()
+            assert np.allclose(shapely.get_coordinates(new_gdf.geometry.values, include_z=True),
+                               shapely.get_coordinates(expected_gdf.geometry.values, include_z=True))
+
+
+if __name__ == "__main__":
+    main()
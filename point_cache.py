@@ -0,0 +1,148 @@
+import collections
+import threading
+
+# third party libs
+from pytransdatro import TransRO
+
+# local
+from itrf2014_to_etrf2014 import itrf2014_to_etrf2014_lon_lat
+from frames import transform_frame_lon_lat
+from stereo70_to_etrs89 import stereo70_to_etrs89_with_pytransdatro
+
+
+# quantization steps of the cache keys, points closer than this share a result
+DEGREES_STEP = 1e-9  # ~0.1 mm on the ground
+METRES_STEP = 1e-4
+EPOCH_STEP = 1e-4  # ~1 hour
+
+
+def _quantize(value: float, step: float):
+    return None if value is None else round(value / step)
+
+
+class PointCache:
+    """
+    Bounded LRU cache of single point transformation results, for control points
+    (EPN stations, cadastral markers) that are asked for again and again.
+
+    Keys are (engine, source frame, target frame, quantized coordinates, quantized height, quantized epoch),
+    the engine keeps results of different implementations of the same frame pair apart.
+    Frames are labelled by name, as in frames.FRAME_PARAMETERS ("ITRF2014", "ETRF2000", ...),
+    plus "Stereo70" and "ETRS89" for the datums PyTransDatRO converts between.
+    """
+
+    def __init__(self, maxsize: int = 100_000):
+        self.maxsize = maxsize
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(engine: str, source_frame: str, target_frame: str, x: float, y: float, height: float,
+                 epoch: float, coords_step: float) -> tuple:
+        return (engine, source_frame, target_frame,
+                _quantize(x, coords_step), _quantize(y, coords_step),
+                _quantize(height, METRES_STEP), _quantize(epoch, EPOCH_STEP))
+
+    def get_or_compute(self, key: tuple, compute):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+        # compute outside the lock, a concurrent miss on the same key only costs a duplicate transform
+        result = compute()
+        with self._lock:
+            self._data[key] = result
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+        return result
+
+    def invalidate(self, source_frame: str = None, target_frame: str = None) -> int:
+        """
+        Drops the entries of a frame pair (either side may be None for any), returns how many.
+        Frames are given by the same labels as in the keys, e.g. invalidate("ITRF2014", "ETRF2014")
+        or invalidate(source_frame="Stereo70"), never EPSG codes.
+        """
+        with self._lock:
+            keys = [key for key in self._data
+                    if (source_frame is None or key[1] == source_frame)
+                    and (target_frame is None or key[2] == target_frame)]
+            for key in keys:
+                del self._data[key]
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+POINT_CACHE = PointCache()
+
+
+def cached_itrf2014_to_etrf2014_lon_lat(lon, lat, elev, observation_epoch, cache: PointCache = POINT_CACHE):
+    key = cache.make_key("itrf2014_to_etrf2014", "ITRF2014", "ETRF2014", lon, lat, elev, observation_epoch, DEGREES_STEP)
+    return cache.get_or_compute(
+        key, lambda: itrf2014_to_etrf2014_lon_lat(lon, lat, elev, observation_epoch))
+
+
+def cached_transform_frame_lon_lat(lon, lat, elev, source_frame: str, target_frame: str, epoch: float,
+                                   cache: PointCache = POINT_CACHE):
+    key = cache.make_key("frames", source_frame, target_frame, lon, lat, elev, epoch, DEGREES_STEP)
+    return cache.get_or_compute(
+        key, lambda: transform_frame_lon_lat(lon, lat, elev, source_frame, target_frame, epoch))
+
+
+def cached_stereo70_to_etrs89_with_pytransdatro(t: TransRO, north: float, east: float, height: float = None,
+                                                cache: PointCache = POINT_CACHE):
+    # Stereo70 has no epoch, ETRS89 is what PyTransDatRO returns
+    key = cache.make_key("pytransdatro", "Stereo70", "ETRS89", east, north, height, None, METRES_STEP)
+    return cache.get_or_compute(
+        key, lambda: stereo70_to_etrs89_with_pytransdatro(t=t, north=north, east=east, height=height))
+
+
+def test_point_cache():
+    cache = PointCache(maxsize=2)
+    lon, lat, elev, epoch = 26.1, 44.43, 100.0, 2024.0
+
+    # a repeat within the quantization step is a hit and returns the very same result
+    result = cached_transform_frame_lon_lat(lon, lat, elev, "ITRF2020", "ETRF2000", epoch, cache=cache)
+    repeat = cached_transform_frame_lon_lat(
+        lon + DEGREES_STEP / 10, lat, elev + METRES_STEP / 10, "ITRF2020", "ETRF2000", epoch, cache=cache)
+    assert repeat is result
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+    # least recently used entry goes first once maxsize is reached
+    cached_itrf2014_to_etrf2014_lon_lat(lon, lat, elev, epoch, cache=cache)
+    cached_transform_frame_lon_lat(lon, lat, elev, "ITRF2020", "ETRF2000", epoch, cache=cache)  # now most recent
+    cached_transform_frame_lon_lat(lon, lat, elev, "ITRF2014", "ETRF2000", epoch, cache=cache)
+    stats = cache.stats()
+    assert stats["size"] == 2 and stats["evictions"] == 1
+    itrf2014_key = cache.make_key("itrf2014_to_etrf2014", "ITRF2014", "ETRF2014", lon, lat, elev, epoch, DEGREES_STEP)
+    assert itrf2014_key not in cache._data
+
+    # invalidate only drops the given pair
+    assert cache.invalidate(source_frame="ITRF2014") == 1
+    assert cache.invalidate(source_frame="Stereo70", target_frame="ETRS89") == 0
+    assert [key[1:3] for key in cache._data] == [("ITRF2020", "ETRF2000")]
+
+    cache.clear()
+    assert cache.stats() == {"size": 0, "maxsize": 2, "hits": 0, "misses": 0, "evictions": 0, "hit_rate": 0.0}
@@ -0,0 +1,225 @@
+import os
+import tempfile
+
+# third party libs
+import numpy as np
+import pandas as pd
+from pytransdatro import TransRO
+
+# local
+from utils import ensure_path_exists
+from transformer_cache import get_transformer
+from frames import transform_frame_xyz_epochs, grs80_cart
+from stereo70_to_etrs89 import stereo70_to_etrs89_with_pytransdatro
+
+
+# packed binary record, x/y/z are lon/lat/height (degrees, metres), east/north/height
+# or geocentric X/Y/Z depending on the reference system, t is the decimal year epoch
+POINT_DTYPE = np.dtype([("x", "<f8"), ("y", "<f8"), ("z", "<f8"), ("t", "<f8")])
+POINT_COLUMNS = list(POINT_DTYPE.names)
+
+
+def _has_header(source_path: str, delimiter: str, skiprows: int) -> bool:
+    # same sep as the data reader, so regex delimiters like r"\s+" split the same way
+    first_row = pd.read_csv(source_path, sep=delimiter, header=None, skiprows=skiprows, nrows=1)
+    if first_row.empty:
+        return False
+    values = pd.to_numeric(first_row.iloc[0, :4], errors="coerce")
+    return bool(values.isna().any())
+
+
+def read_points_text(source_path: str, chunk_size: int = 1_000_000, delimiter: str = ",",
+                     columns: list[str] = None, skiprows: int = 0):
+    """
+    Reads delimited x, y, z, t text in chunks, without building geometries.
+
+    Args:
+        columns: names of the x, y, z, t columns in the header. When None and the file has a header
+            (as written by write_points_text) the x, y, z, t columns are used if present, otherwise
+            the first four columns, in either case read as x, y, z, t.
+
+    Yields:
+        structured arrays of POINT_DTYPE with at most chunk_size points
+    """
+    if columns is None and not _has_header(source_path, delimiter, skiprows):
+        reader = pd.read_csv(source_path, sep=delimiter, header=None, usecols=[0, 1, 2, 3],
+                             names=POINT_COLUMNS, skiprows=skiprows,
+                             dtype=np.float64, chunksize=chunk_size)
+    else:
+        if columns is None:
+            header = pd.read_csv(source_path, sep=delimiter, skiprows=skiprows, nrows=0).columns
+            columns = POINT_COLUMNS if set(POINT_COLUMNS) <= set(header) else list(header[:4])
+        reader = pd.read_csv(source_path, sep=delimiter, usecols=columns, skiprows=skiprows,
+                             dtype=np.float64, chunksize=chunk_size)
+    for chunk in reader:
+        if columns is not None:
+            chunk = chunk[columns]
+        points = np.empty(len(chunk), dtype=POINT_DTYPE)
+        for name, column in zip(POINT_COLUMNS, chunk.columns):
+            points[name] = chunk[column].to_numpy()
+        yield points
+
+
+def read_points_binary(source_path: str, chunk_size: int = 1_000_000):
+    """
+    Memory-maps a packed POINT_DTYPE file, pages are only loaded when a chunk is transformed.
+
+    Yields:
+        read-only views of POINT_DTYPE with at most chunk_size points
+    """
+    # mmap refuses empty files, an empty file simply has no chunks
+    if os.path.getsize(source_path) == 0:
+        return
+    points = np.memmap(source_path, dtype=POINT_DTYPE, mode="r")
+    for start in range(0, len(points), chunk_size):
+        yield points[start:start + chunk_size]
+
+
+def read_points(source_path: str, chunk_size: int = 1_000_000, **kwargs):
+    if source_path.endswith((".bin", ".xyzt")):
+        return read_points_binary(source_path, chunk_size)
+    return read_points_text(source_path, chunk_size, **kwargs)
+
+
+def write_points_binary(chunks, destination_path: str) -> int:
+    n_points = 0
+    with open(destination_path, "wb") as f:
+        for points in chunks:
+            f.write(np.ascontiguousarray(points, dtype=POINT_DTYPE).tobytes())
+            n_points += len(points)
+    return n_points
+
+
+def write_points_text(chunks, destination_path: str, delimiter: str = ",") -> int:
+    n_points = 0
+    with open(destination_path, "w") as f:
+        f.write(delimiter.join(POINT_COLUMNS) + "\n")
+        for points in chunks:
+            np.savetxt(f, points.view((np.float64, 4)), fmt="%.10f", delimiter=delimiter)
+            n_points += len(points)
+    return n_points
+
+
+def pyproj_transform_points(points: np.ndarray, source_refsys_epsg: int, target_refsys_epsg: int) -> np.ndarray:
+    """ Transforms a POINT_DTYPE chunk between EPSG codes in one PROJ call, each point at its own epoch """
+    transformer = get_transformer(source_refsys_epsg, target_refsys_epsg)
+    new_points = np.empty(len(points), dtype=POINT_DTYPE)
+    new_points["x"], new_points["y"], new_points["z"], new_points["t"] = transformer.transform(
+        xx=points["x"], yy=points["y"], zz=points["z"], tt=points["t"])
+    return new_points
+
+
+def frames_transform_points(points: np.ndarray, source_frame: str, target_frame: str) -> np.ndarray:
+    """ Transforms a POINT_DTYPE chunk of lon/lat/height between ITRF/ETRF frames, see frames.py """
+    cart = grs80_cart()
+    x, y, z = cart.transform(points["x"], points["y"], points["z"])
+    xyz = transform_frame_xyz_epochs(
+        np.column_stack([x, y, z]), source_frame, target_frame, points["t"])
+    new_points = np.empty(len(points), dtype=POINT_DTYPE)
+    new_points["x"], new_points["y"], new_points["z"] = cart.transform(
+        xyz[:, 0], xyz[:, 1], xyz[:, 2], direction="INVERSE")
+    new_points["t"] = points["t"]
+    return new_points
+
+
+def stereo70_to_etrs89_points(points: np.ndarray, t: TransRO) -> np.ndarray:
+    """ Stereo70 east/north/height chunk to ETRS89 lon/lat/height, PyTransDatRO only works point by point """
+    new_points = np.empty(len(points), dtype=POINT_DTYPE)
+    for i, (east, north, height, epoch) in enumerate(points.tolist()):
+        lat, lon, alt = stereo70_to_etrs89_with_pytransdatro(
+            t=t, north=north, east=east, height=height)
+        new_points[i] = lon, lat, alt, epoch
+    return new_points
+
+
+def transform_points_file(source_path: str, destination_path: str, transform_func,
+                          chunk_size: int = 1_000_000, read_kwargs: dict = None, **kwargs) -> int:
+    """
+    Streams a point file through transform_func chunk by chunk, memory stays bounded by chunk_size.
+    The output is packed binary for .bin/.xyzt destinations and csv otherwise.
+    read_kwargs go to read_points_text (delimiter, columns, skiprows), kwargs to transform_func.
+
+    Returns:
+        the number of points written
+    """
+    chunks = (transform_func(points, **kwargs) for points in read_points(source_path, chunk_size, **(read_kwargs or {})))
+    if destination_path.endswith((".bin", ".xyzt")):
+        return write_points_binary(chunks, destination_path)
+    return write_points_text(chunks, destination_path)
+
+
+def main():
+    ############
+    # settings #
+    ############
+    campaign_id = "rompos_2024"
+    chunk_size = 1_000_000
+
+    source_refsys = "ITRF2020"
+    target_refsys = "ETRF2000"
+
+    source_path = os.path.join('data', 'points', source_refsys, f"{campaign_id}.xyzt")
+    destination_data_dir = os.path.join('data', 'points', target_refsys)
+    ensure_path_exists(destination_data_dir)
+    destination_path = os.path.join(destination_data_dir, f"{campaign_id}.xyzt")
+
+    n_points = transform_points_file(
+        source_path=source_path,
+        destination_path=destination_path,
+        transform_func=frames_transform_points,
+        chunk_size=chunk_size,
+        source_frame=source_refsys,
+        target_frame=target_refsys,
+    )
+    # other engines:
+    # transform_func=pyproj_transform_points, source_refsys_epsg=7912, target_refsys_epsg=7931
+    # transform_func=stereo70_to_etrs89_points, t=TransRO()
+    print(f"Transformed {n_points} points from {source_refsys} to {target_refsys}")
+
+
+def test_points_round_trip():
+    rng = np.random.default_rng(0)
+    points = np.empty(2500, dtype=POINT_DTYPE)
+    points["x"] = 26 + rng.random(len(points))
+    points["y"] = 44 + rng.random(len(points))
+    points["z"] = 100 + rng.random(len(points))
+    points["t"] = 2010 + 10 * rng.random(len(points))
+    tmp_dir = tempfile.mkdtemp()
+
+    # the readers get back what the writers wrote
+    for file_name in ["points.xyzt", "points.csv"]:
+        path = os.path.join(tmp_dir, file_name)
+        if path.endswith(".xyzt"):
+            write_points_binary([points[:1000], points[1000:]], path)
+        else:
+            write_points_text([points[:1000], points[1000:]], path)
+        read_back = np.concatenate(list(read_points(path, chunk_size=1000)))
+        assert np.allclose(read_back.view((np.float64, 4)), points.view((np.float64, 4)), rtol=0, atol=1e-9)
+
+    # whitespace separated xyz without header, regex delimiter
+    path = os.path.join(tmp_dir, "points.xyz")
+    np.savetxt(path, points[:3].view((np.float64, 4)), fmt="%.10f", delimiter="   ")
+    read_back = np.concatenate(list(read_points(path, delimiter=r"\s+")))
+    assert len(read_back) == 3
+
+    # an empty binary file has no chunks
+    path = os.path.join(tmp_dir, "empty.xyzt")
+    open(path, "wb").close()
+    assert list(read_points(path)) == []
+
+    # ITRF2020 -> ETRF2000 and back, through csv and xyzt outputs of transform_points_file
+    for extension in ["csv", "xyzt"]:
+        source_path = os.path.join(tmp_dir, f"points.{extension}")
+        etrf_path = os.path.join(tmp_dir, f"etrf2000.{extension}")
+        itrf_path = os.path.join(tmp_dir, f"itrf2020.{extension}")
+        transform_points_file(source_path, etrf_path, frames_transform_points, chunk_size=1000,
+                              source_frame="ITRF2020", target_frame="ETRF2000")
+        n_points = transform_points_file(etrf_path, itrf_path, frames_transform_points, chunk_size=1000,
+                                         source_frame="ETRF2000", target_frame="ITRF2020")
+        assert n_points == len(points)
+        read_back = np.concatenate(list(read_points(itrf_path)))
+        assert np.allclose(read_back.view((np.float64, 4)), points.view((np.float64, 4)), rtol=0, atol=1e-6)
+
+
+if __name__ == "__main__":
+    main()
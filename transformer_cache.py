@@ -0,0 +1,274 @@
+import contextlib
+import functools
+import json
+import os
+import pathlib
+import re
+import tempfile
+
+try:
+    import fcntl
+except ImportError:  # Windows, only the merge before writing protects the cache there
+    fcntl = None
+
+# third party libs
+import pyproj
+from pyproj.transformer import TransformerGroup
+
+
+# JSON file holding the resolved pipelines, one entry per PROJ version and CRS pair.
+# Lives next to the PROJ user grids, override with ETRS89_PIPELINE_CACHE.
+PIPELINE_CACHE_ENV = "ETRS89_PIPELINE_CACHE"
+PIPELINE_CACHE_FILE = "etrs89_to_wgs84_pipelines.json"
+
+# +nadgrids=a.gsb,@b.gsb / +geoidgrids=... / +grids=... / +file=... in a PROJ string
+_GRID_PARAM_RE = re.compile(r"\+(?:nad|geoid)?grids=(\S+)|\+file=(\S+)")
+
+
+def pipeline_cache_path() -> pathlib.Path:
+    path = os.environ.get(PIPELINE_CACHE_ENV)
+    if path:
+        return pathlib.Path(path)
+    return pathlib.Path(pyproj.datadir.get_user_data_dir()) / PIPELINE_CACHE_FILE
+
+
+def _cache_key(source_refsys_epsg: int, target_refsys_epsg: int) -> str:
+    return f"EPSG:{source_refsys_epsg}->EPSG:{target_refsys_epsg}"
+
+
+def _read_cache(cache_path: pathlib.Path) -> dict:
+    try:
+        with open(cache_path, encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _write_cache(cache_path: pathlib.Path, cache: dict):
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    # write to a temp file and rename, so parallel workers never read half a file
+    fd, tmp_path = tempfile.mkstemp(dir=cache_path.parent, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(cache, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, cache_path)
+
+
+def _grid_search_dirs() -> list[pathlib.Path]:
+    dirs = [pathlib.Path(p) for p in pyproj.datadir.get_data_dir().split(os.pathsep) if p]
+    dirs.append(pathlib.Path(pyproj.datadir.get_user_data_dir()))
+    return dirs
+
+
+def pipeline_grids(pipeline: str) -> list[tuple[str, bool]]:
+    """
+    Lists the grid files referenced by a PROJ pipeline string.
+
+    Returns:
+        list of (grid name, optional) tuples, grids prefixed with "@" in PROJ are optional.
+    """
+    grids = []
+    for match in _GRID_PARAM_RE.finditer(pipeline):
+        for name in (match.group(1) or match.group(2)).split(","):
+            if name:
+                grids.append((name.lstrip("@"), name.startswith("@")))
+    return grids
+
+
+def check_grids_available(pipeline: str):
+    """
+    Preflight check that every required grid of a pipeline exists locally.
+    Raises FileNotFoundError before any point gets transformed.
+    """
+    search_dirs = _grid_search_dirs()
+    missing = []
+    for name, optional in pipeline_grids(pipeline):
+        if optional:
+            continue
+        if os.path.isabs(name) and os.path.exists(name):
+            continue
+        if not any((d / name).exists() for d in search_dirs):
+            missing.append(name)
+    if missing:
+        raise FileNotFoundError(
+            f"Missing PROJ grid files {missing}, searched in {[str(d) for d in search_dirs]}. "
+            "Install them with `projsync --file <name>` before running the job.")
+
+
+def _from_crs(source_refsys_epsg: int, target_refsys_epsg: int) -> pyproj.Transformer:
+    return pyproj.Transformer.from_crs(
+        f"EPSG:{source_refsys_epsg}", f"EPSG:{target_refsys_epsg}",
+        always_xy=True,
+        allow_ballpark=False
+    )
+
+
+def _transformer_group(source_refsys_epsg: int, target_refsys_epsg: int) -> TransformerGroup:
+    return TransformerGroup(
+        f"EPSG:{source_refsys_epsg}", f"EPSG:{target_refsys_epsg}",
+        always_xy=True,
+        allow_ballpark=False
+    )
+
+
+def check_operations_available(group: TransformerGroup, source_refsys_epsg: int, target_refsys_epsg: int):
+    """
+    Preflight on the PROJ operation search: PROJ silently drops the operations whose grids are
+    missing and falls back to weaker ones. Raises FileNotFoundError listing the missing grids instead.
+    """
+    if group.best_available and not group.unavailable_operations:
+        return
+    missing = sorted({grid.short_name for operation in group.unavailable_operations
+                      for grid in operation.grids if not grid.available})
+    raise FileNotFoundError(
+        f"Missing PROJ grid files {missing} for EPSG:{source_refsys_epsg} -> EPSG:{target_refsys_epsg}. "
+        "Install them with `projsync --file <name>` before running the job.")
+
+
+def _area_bounds(transformer: pyproj.Transformer):
+    area = transformer.area_of_use
+    return None if area is None else tuple(area.bounds)
+
+
+def resolve_pipeline(source_refsys_epsg: int, target_refsys_epsg: int) -> dict:
+    """
+    Let PROJ search its database once and return the chosen pipeline with its accuracy.
+    Raises FileNotFoundError when grids are missing, nothing gets cached then.
+
+    When several operations are candidates PROJ only picks one per point in proj_trans.
+    If all candidates share the same area of use the best ranked one is kept, otherwise
+    the choice depends on the point and the entry has "pipeline": None, get_transformer
+    then uses Transformer.from_crs.
+    """
+    group = _transformer_group(source_refsys_epsg, target_refsys_epsg)
+    check_operations_available(group, source_refsys_epsg, target_refsys_epsg)
+
+    # sorted by PROJ, best accuracy and largest area first
+    candidates = group.transformers
+    entry = {"pipeline": None, "accuracy": None, "description": None, "candidates": len(candidates)}
+    if candidates and len({_area_bounds(t) for t in candidates}) == 1 and candidates[0].to_proj4():
+        entry.update({
+            "pipeline": candidates[0].to_proj4(),
+            "accuracy": candidates[0].accuracy,
+            "description": candidates[0].description,
+        })
+    return entry
+
+
+@contextlib.contextmanager
+def _locked(cache_path: pathlib.Path):
+    """ Exclusive lock around the read-merge-write of the cache, parallel workers share the file """
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(cache_path.with_suffix(".lock"), "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+@functools.lru_cache(maxsize=None)
+def cached_pipeline(source_refsys_epsg: int, target_refsys_epsg: int,
+                    cache_path: pathlib.Path = None) -> dict:
+    """
+    Returns the cached pipeline entry for a CRS pair, resolving and storing it on a miss.
+    Entries are keyed by PROJ version, an upgrade of PROJ resolves everything again.
+    Pairs that cannot be reduced to one pipeline are stored too, with "pipeline": None.
+    Memoized, the JSON file is read once per pair and process.
+    """
+    cache_path = pathlib.Path(cache_path) if cache_path else pipeline_cache_path()
+    key = _cache_key(source_refsys_epsg, target_refsys_epsg)
+    entry = _read_cache(cache_path).get(pyproj.proj_version_str, {}).get(key)
+    # entries without "candidates" were written by older versions of this module, resolve them again
+    if entry is not None and "candidates" in entry:
+        return entry
+
+    entry = resolve_pipeline(source_refsys_epsg, target_refsys_epsg)
+    with _locked(cache_path):
+        # merge with what other workers wrote in the meantime
+        cache = _read_cache(cache_path)
+        cache.setdefault(pyproj.proj_version_str, {})[key] = entry
+        _write_cache(cache_path, cache)
+    return entry
+
+
+@functools.lru_cache(maxsize=None)
+def get_transformer(source_refsys_epsg: int, target_refsys_epsg: int) -> pyproj.Transformer:
+    """
+    Builds the EPSG:source -> EPSG:target transformer (always_xy) from the persisted pipeline,
+    skipping the PROJ operation search. Memoized, so a worker builds each pair only once.
+    Falls back to Transformer.from_crs when the pair has no single pipeline.
+    Raises FileNotFoundError when a required grid is missing.
+    """
+    entry = cached_pipeline(source_refsys_epsg, target_refsys_epsg)
+    if entry["pipeline"] is None:
+        group = _transformer_group(source_refsys_epsg, target_refsys_epsg)
+        check_operations_available(group, source_refsys_epsg, target_refsys_epsg)
+        return _from_crs(source_refsys_epsg, target_refsys_epsg)
+    check_grids_available(entry["pipeline"])
+    return pyproj.Transformer.from_pipeline(entry["pipeline"])
+
+
+def get_transformer_accuracy(source_refsys_epsg: int, target_refsys_epsg: int) -> float:
+    # from_pipeline transformers report no accuracy, read the one stored at resolve time
+    entry = cached_pipeline(source_refsys_epsg, target_refsys_epsg)
+    if entry["pipeline"] is None:
+        return get_transformer(source_refsys_epsg, target_refsys_epsg).accuracy
+    return entry["accuracy"]
+
+
+def _clear_memo():
+    cached_pipeline.cache_clear()
+    get_transformer.cache_clear()
+
+
+def test_transformer_cache():
+    cache_path = pathlib.Path(tempfile.mkdtemp()) / PIPELINE_CACHE_FILE
+    os.environ[PIPELINE_CACHE_ENV] = str(cache_path)
+    _clear_memo()
+    version = pyproj.proj_version_str
+    # a pipeline-less entry as written by older versions must be resolved again, not used
+    _write_cache(cache_path, {version: {_cache_key(9000, 9069): {"pipeline": None, "accuracy": -1}}})
+    try:
+        # one candidate operation: ETRF2000 (geog3D) -> ITRF2020 (geog2D)
+        # several candidates: ITRF2014 -> ETRF2014 (1) and (2), same area of use
+        for source, target, point in [(7931, 9990, (26.1, 44.43, 100.0, 2022.0)),
+                                      (9000, 9069, (26.1, 44.43, 100.0, 2024.45))]:
+            reference = _from_crs(source, target).transform(*point)
+            for _ in range(2):  # resolve and write, then read back from disk
+                _clear_memo()
+                result = get_transformer(source, target).transform(*point)
+                print(source, target, result, get_transformer_accuracy(source, target))
+                assert all(abs(a - b) < 1e-9 for a, b in zip(result, reference))
+            entry = _read_cache(cache_path)[version][_cache_key(source, target)]
+            assert entry["pipeline"] is not None
+        # both pairs survived the read-merge-write of each other
+        assert len(_read_cache(cache_path)[version]) == 2
+
+        # a stored negative entry is honoured, from_crs is used without searching again
+        cache = _read_cache(cache_path)
+        cache[version][_cache_key(7931, 9990)] = {"pipeline": None, "accuracy": None,
+                                                  "description": None, "candidates": 2}
+        _write_cache(cache_path, cache)
+        _clear_memo()
+        point = (26.1, 44.43, 100.0, 2022.0)
+        assert get_transformer(7931, 9990).transform(*point) == _from_crs(7931, 9990).transform(*point)
+        assert cached_pipeline(7931, 9990) is cached_pipeline(7931, 9990)
+
+        # NAD27 -> NAD83 needs NTv2/NADCON grids, without them the preflight fails and nothing is cached
+        if not _transformer_group(4267, 4269).best_available:
+            _clear_memo()
+            try:
+                get_transformer(4267, 4269)
+                raise AssertionError("expected FileNotFoundError for the missing grids")
+            except FileNotFoundError as err:
+                print(err)
+            assert _cache_key(4267, 4269) not in _read_cache(cache_path)[version]
+    finally:
+        del os.environ[PIPELINE_CACHE_ENV]
+        _clear_memo()
+
+
+if __name__ == "__main__":
+    test_transformer_cache()
@@ -0,0 +1,308 @@
+import functools
+import math
+import os
+import tempfile
+import time
+
+# third party libs
+import numpy as np
+import pandas as pd
+import shapely
+import geopandas as gpd
+import dask_geopandas
+
+# local
+from points import (POINT_DTYPE, frames_transform_points, pyproj_transform_points, transform_points_file,
+                    write_points_binary)
+from frames import transform_frame_lon_lat
+from partitioned import pyproj_transform_partition, transform_partitioned
+
+
+# GRS80 semi-major axis, good enough to turn degree differences into metres for error statistics
+EARTH_RADIUS = 6378137.0
+PERCENTILES = (50, 95, 99, 100)
+
+
+def point_errors(points: np.ndarray, reference: np.ndarray, geographic: bool = True) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Horizontal and vertical differences in metres between two POINT_DTYPE arrays.
+    geographic: x/y are lon/lat in degrees, otherwise x/y are already metres.
+    """
+    dx = points["x"] - reference["x"]
+    dy = points["y"] - reference["y"]
+    if geographic:
+        dx = np.radians(dx) * EARTH_RADIUS * np.cos(np.radians(reference["y"]))
+        dy = np.radians(dy) * EARTH_RADIUS
+    horizontal = np.hypot(dx, dy)
+    vertical = np.abs(points["z"] - reference["z"])
+    return horizontal, vertical
+
+
+def _percentiles(name: str, errors: np.ndarray, percentiles) -> dict:
+    # 2D geometries have no heights to compare
+    if len(errors) == 0 or np.isnan(errors).all():
+        return {}
+    values = np.nanpercentile(errors, percentiles)
+    return {f"{name}_p{p}": float(v) for p, v in zip(percentiles, values)}
+
+
+def validate_batch(points: np.ndarray, new_points: np.ndarray, reference_func, inverse_func=None,
+                   sample_size: int = 1000, geographic: bool = True, percentiles=PERCENTILES,
+                   rng: np.random.Generator = None) -> dict:
+    """
+    Checks a random sample of an already transformed batch against the exact reference engine
+    and, when inverse_func is given, against the round trip back to the source coordinates.
+
+    Args:
+        points: POINT_DTYPE source batch
+        new_points: output of the fast transform for points
+        reference_func: exact transform, POINT_DTYPE array -> POINT_DTYPE array
+        inverse_func: inverse of the fast transform, POINT_DTYPE array -> POINT_DTYPE array
+
+    Returns:
+        report with the sample size, error percentiles in metres and the validation time
+    """
+    start = time.perf_counter()
+    rng = rng if rng is not None else np.random.default_rng()
+    sample_size = min(sample_size, len(points))
+    idx = np.sort(rng.choice(len(points), size=sample_size, replace=False))
+    sample = np.ascontiguousarray(points[idx], dtype=POINT_DTYPE)
+    new_sample = new_points[idx]
+
+    report = {"points": len(points), "sampled": sample_size}
+    horizontal, vertical = point_errors(new_sample, reference_func(sample), geographic)
+    report.update(_percentiles("reference_horizontal", horizontal, percentiles))
+    report.update(_percentiles("reference_vertical", vertical, percentiles))
+    if inverse_func is not None:
+        horizontal, vertical = point_errors(inverse_func(new_sample), sample, geographic)
+        report.update(_percentiles("roundtrip_horizontal", horizontal, percentiles))
+        report.update(_percentiles("roundtrip_vertical", vertical, percentiles))
+    report["validation_s"] = time.perf_counter() - start
+    return report
+
+
+def _as_geoseries(batch) -> gpd.GeoSeries:
+    return batch.geometry if isinstance(batch, gpd.GeoDataFrame) else batch
+
+
+def geoseries_points(geoms: gpd.GeoSeries) -> np.ndarray:
+    """ Vertices of every geometry as a POINT_DTYPE array, z is nan for 2D geometries and t is unknown """
+    coords = shapely.get_coordinates(geoms.values, include_z=True)
+    points = np.empty(len(coords), dtype=POINT_DTYPE)
+    points["x"], points["y"], points["z"] = coords[:, 0], coords[:, 1], coords[:, 2]
+    points["t"] = np.nan
+    return points
+
+
+def validate_geoseries_batch(batch, new_batch, reference_func, inverse_func=None,
+                             sample_size: int = 1000, geographic: bool = True, percentiles=PERCENTILES,
+                             rng: np.random.Generator = None) -> dict:
+    """
+    validate_batch for GeoSeries / GeoDataFrame batches, e.g. the partitions of partitioned.py.
+    A random sample of geometries is checked, all their vertices are compared.
+
+    Args:
+        batch: GeoSeries or GeoDataFrame source batch
+        new_batch: output of the fast transform for batch
+        reference_func, inverse_func: take and return the same type as the fast transform
+    """
+    start = time.perf_counter()
+    rng = rng if rng is not None else np.random.default_rng()
+    sample_size = min(sample_size, len(batch))
+    idx = np.sort(rng.choice(len(batch), size=sample_size, replace=False))
+    sample = batch.iloc[idx]
+    new_sample = new_batch.iloc[idx]
+    new_points = geoseries_points(_as_geoseries(new_sample))
+
+    report = {"geometries": len(batch), "sampled": sample_size, "sampled_points": len(new_points)}
+    horizontal, vertical = point_errors(
+        new_points, geoseries_points(_as_geoseries(reference_func(sample))), geographic)
+    report.update(_percentiles("reference_horizontal", horizontal, percentiles))
+    report.update(_percentiles("reference_vertical", vertical, percentiles))
+    if inverse_func is not None:
+        horizontal, vertical = point_errors(
+            geoseries_points(_as_geoseries(inverse_func(new_sample))),
+            geoseries_points(_as_geoseries(sample)), geographic)
+        report.update(_percentiles("roundtrip_horizontal", horizontal, percentiles))
+        report.update(_percentiles("roundtrip_vertical", vertical, percentiles))
+    report["validation_s"] = time.perf_counter() - start
+    return report
+
+
+def validated_transform(transform_func, reference_func, inverse_func=None,
+                        sample_fraction: float = 0.001, max_samples: int = 1000,
+                        geographic: bool = True, percentiles=PERCENTILES,
+                        seed: int = None, reports: list = None, partitioned: bool = False):
+    """
+    Wraps a batch transform so that every batch is validated. Batches are POINT_DTYPE arrays
+    (points.transform_points_file) or GeoSeries / GeoDataFrame, e.g. partitioned.pyproj_transform_partition
+    passed to map_partitions; there the sample is counted in geometries and, without `reports`,
+    the reports are printed in the worker logs. Keyword arguments of the call, like the
+    target_refsys_epsg of partitioned.transform_partitioned, are forwarded to transform_func.
+
+    partitioned: the wrapper runs under map_partitions, every worker gets its own copy of it.
+        The batch number is then dask's partition number and the sample of a partition is drawn
+        from (seed, partition number), so copies never repeat numbers or sample indices.
+        Calls without partition_info are dask's meta inference on fake rows and are not validated.
+
+    Overhead: per batch at most min(max_samples, ceil(sample_fraction * n)) points go through
+    reference_func and inverse_func once more, so the extra time is bounded by
+    max_samples * (reference + inverse cost per point) whatever the batch size; with the defaults and
+    1M point batches that is 1000 points, i.e. 0.1 % of the batch run through the slow engines.
+    The measured overhead is reported as validation_s and overhead (validation_s / transform_s).
+
+    Returns:
+        a function taking a batch and returning transform_func(batch), reports are
+        appended to `reports` when given and printed otherwise.
+    """
+    rng = np.random.default_rng(seed)
+    batch_number = 0
+
+    def _transform(points, partition_info: dict = None, **kwargs):
+        nonlocal batch_number
+        start = time.perf_counter()
+        new_points = transform_func(points, **kwargs)
+        transform_s = time.perf_counter() - start
+
+        if partitioned:
+            if partition_info is None:
+                return new_points
+            number = partition_info["number"]
+            batch_rng = np.random.default_rng(None if seed is None else [seed, number])
+        else:
+            number = batch_number
+            batch_rng = rng
+            batch_number += 1
+
+        sample_size = min(max_samples, math.ceil(sample_fraction * len(points)))
+        if isinstance(points, (gpd.GeoSeries, gpd.GeoDataFrame)):
+            validate = validate_geoseries_batch
+        else:
+            validate = validate_batch
+        report = validate(points, new_points, reference_func, inverse_func,
+                          sample_size, geographic, percentiles, batch_rng)
+        report["batch"] = number
+        report["transform_s"] = transform_s
+        report["overhead"] = report["validation_s"] / transform_s if transform_s else 0.0
+
+        if reports is not None:
+            reports.append(report)
+        else:
+            print(report)
+        return new_points
+
+    return _transform
+
+
+def main():
+    ############
+    # settings #
+    ############
+    campaign_id = "rompos_2024"
+    source_path = os.path.join('data', 'points', 'ITRF2020', f"{campaign_id}.xyzt")
+    destination_path = os.path.join('data', 'points', 'ETRF2000', f"{campaign_id}.xyzt")
+
+    # fast engine: frame library, reference engine: PROJ
+    # EPSG:9989 ITRF2020 - Geographic 3D, EPSG:7931 ETRF2000 - Geographic 3D
+    transform = validated_transform(
+        transform_func=functools.partial(
+            frames_transform_points, source_frame="ITRF2020", target_frame="ETRF2000"),
+        reference_func=functools.partial(
+            pyproj_transform_points, source_refsys_epsg=9989, target_refsys_epsg=7931),
+        inverse_func=functools.partial(
+            frames_transform_points, source_frame="ETRF2000", target_frame="ITRF2020"),
+        sample_fraction=0.001,
+        max_samples=1000,
+    )
+    transform_points_file(source_path, destination_path, transform)
+
+
+def test_validated_points():
+    # POINT_DTYPE path: frame library through transform_points_file, PROJ as reference
+    # EPSG:9989 ITRF2020 - Geographic 3D, EPSG:7931 ETRF2000 - Geographic 3D
+    rng = np.random.default_rng(0)
+    points = np.empty(2500, dtype=POINT_DTYPE)
+    points["x"] = 26 + rng.random(len(points))
+    points["y"] = 44 + rng.random(len(points))
+    points["z"] = 100 + rng.random(len(points))
+    points["t"] = 2010 + 10 * rng.random(len(points))
+    tmp_dir = tempfile.mkdtemp()
+    source_path = os.path.join(tmp_dir, "itrf2020.xyzt")
+    write_points_binary([points], source_path)
+
+    reports = []
+    transform = validated_transform(
+        transform_func=frames_transform_points,
+        reference_func=functools.partial(
+            pyproj_transform_points, source_refsys_epsg=9989, target_refsys_epsg=7931),
+        inverse_func=functools.partial(
+            frames_transform_points, source_frame="ETRF2000", target_frame="ITRF2020"),
+        sample_fraction=0.1,
+        reports=reports,
+        seed=0,
+    )
+    n_points = transform_points_file(source_path, os.path.join(tmp_dir, "etrf2000.xyzt"), transform,
+                                     chunk_size=1000, source_frame="ITRF2020", target_frame="ETRF2000")
+    print(reports)
+    assert n_points == len(points)
+    assert [report["batch"] for report in reports] == [0, 1, 2]
+    assert [report["sampled"] for report in reports] == [100, 100, 50]
+    assert all(report["reference_horizontal_p100"] < 0.001 for report in reports)
+    assert all(report["reference_vertical_p100"] < 0.001 for report in reports)
+    assert all(report["roundtrip_horizontal_p100"] < 1e-6 for report in reports)
+
+
+def test_validated_partition():
+    # fast engine: cached PROJ pipeline, reference engine: frame library, inverse: PROJ back
+    # EPSG:7931 ETRF2000 - Geographic 3D, EPSG:9989 ITRF2020 - Geographic 3D
+    source_path = os.path.join(
+        'data', 'convert_transdatro', '403', '179169', '7931', '229896', '229896.geojson')
+    partition = gpd.read_file(source_path)
+    observation_epoch = 2022.0
+
+    def frames_reference(batch: gpd.GeoDataFrame) -> gpd.GeoSeries:
+        def _transform(coords: np.ndarray) -> np.ndarray:
+            return np.column_stack(transform_frame_lon_lat(
+                coords[:, 0], coords[:, 1], coords[:, 2], "ETRF2000", "ITRF2020", observation_epoch))
+        return gpd.GeoSeries(shapely.transform(batch.geometry.values, _transform, include_z=True))
+
+    def make_transform(reports: list, partitioned: bool = False):
+        return validated_transform(
+            transform_func=functools.partial(
+                pyproj_transform_partition, alt=112, source_refsys_epsg=7931,
+                observation_epoch=observation_epoch),
+            reference_func=frames_reference,
+            inverse_func=functools.partial(
+                pyproj_transform_partition, alt=112, source_refsys_epsg=9989,
+                target_refsys_epsg=7931, observation_epoch=observation_epoch),
+            sample_fraction=1.0,
+            reports=reports,
+            seed=0,
+            partitioned=partitioned,
+        )
+
+    reports = []
+    new_partition = make_transform(reports)(partition, target_refsys_epsg=9989)
+    print(reports)
+    assert len(new_partition) == len(partition)
+    assert reports[0]["sampled"] == len(partition)
+    assert reports[0]["reference_horizontal_p100"] < 0.001
+    assert reports[0]["roundtrip_horizontal_p100"] < 0.001
+
+    # under dask: target_refsys_epsg comes from transform_partitioned, batches are numbered by
+    # partition, and map_partitions without meta does not validate its meta inference dry run
+    ddf = dask_geopandas.from_geopandas(pd.concat([partition] * 4, ignore_index=True), npartitions=2)
+    for with_meta in [True, False]:
+        reports = []
+        transform = make_transform(reports, partitioned=True)
+        if with_meta:
+            new_ddf = transform_partitioned(ddf, transform, 9989)
+        else:
+            new_ddf = ddf.map_partitions(transform, target_refsys_epsg=9989)
+        assert len(new_ddf.compute(scheduler="synchronous")) == 4 * len(partition)
+        assert sorted(report["batch"] for report in reports) == [0, 1]
+        assert all(report["reference_horizontal_p100"] < 0.001 for report in reports)
+
+
+if __name__ == "__main__":
+    main()